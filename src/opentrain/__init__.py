@@ -3,17 +3,28 @@
 __author__ = "Alvaro Bartolome <alvarobartt@gmail.com>"
 __version__ = "0.1.0"
 
+from opentrain.credentials import Credential, CredentialPool
 from opentrain.dataset import Dataset, File, list_datasets, list_files
+from opentrain.dedup import Deduplicator
+from opentrain.evaluate import Evaluator
 from opentrain.inference import Inference, list_fine_tunes
+from opentrain.resilience import Resilience
+from opentrain.sampler import StratifiedSampler
 from opentrain.train import FineTune, Train
 
 __all__ = [
+    "Credential",
+    "CredentialPool",
     "Dataset",
     "File",
     "list_datasets",
     "list_files",
+    "Deduplicator",
+    "Evaluator",
     "Inference",
     "list_fine_tunes",
+    "Resilience",
+    "StratifiedSampler",
     "Train",
     "FineTune",
 ]
@@ -0,0 +1,565 @@
+import asyncio
+import itertools
+import re
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Tuple,
+    Union,
+)
+
+import openai
+from openai.error import OpenAIError, RateLimitError
+
+# Sliding window used to track the requests per minute sent with each credential
+RATE_LIMIT_WINDOW = 60.0
+
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+# The owner of a resource (files, fine-tunes, fine-tuned models), which is either an
+# organization, or the account of an API key without organization
+Owner = Tuple[Union[str, None], Union[str, None]]
+
+
+def _parse_duration(value: str) -> float:
+    """Parses the durations in OpenAI's rate limit headers, e.g. `6m0s` or `20ms`."""
+    return sum(
+        float(amount) * _DURATION_UNITS[unit]
+        for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    )
+
+
+@dataclass
+class Credential:
+    """An OpenAI API key, optionally bound to an organization, and its health.
+
+    Args:
+        api_key: the OpenAI API key.
+        organization: the OpenAI organization ID (e.g. `org-1234`). Defaults to None.
+        requests_per_minute: the rate limit of the API key, if known, so that it's
+            not exceeded. Defaults to None.
+    """
+
+    api_key: str
+    organization: Union[str, None] = None
+    requests_per_minute: Union[int, None] = None
+    in_flight: int = field(default=0, repr=False)
+    drained_until: float = field(default=0.0, repr=False)
+    rate_limits: int = field(default=0, repr=False)
+    last_used: int = field(default=-1, repr=False)
+    _sent_at: Deque[float] = field(default_factory=deque, repr=False)
+    _reported_remaining: Union[int, None] = field(default=None, repr=False)
+    _reported_at: float = field(default=0.0, repr=False)
+    _reported_reset_at: float = field(default=0.0, repr=False)
+
+    def remaining_requests(self, now: float) -> Union[int, None]:
+        """Returns the estimated remaining requests, either within the current minute
+        if the rate limit of the API key is known, or until the reset reported by
+        OpenAI in the `x-ratelimit-*` headers, or None if both are unknown."""
+        while self._sent_at and self._sent_at[0] <= now - RATE_LIMIT_WINDOW:
+            self._sent_at.popleft()
+        estimates = []
+        if self.requests_per_minute is not None:
+            estimates.append(self.requests_per_minute - len(self._sent_at))
+        if self._reported_remaining is not None and now < self._reported_reset_at:
+            estimates.append(
+                self._reported_remaining
+                - sum(1 for sent_at in self._sent_at if sent_at > self._reported_at)
+            )
+        return min(estimates) if estimates else None
+
+    def recovers_in(self, now: float) -> float:
+        """Returns the seconds until the exhausted quota of the API key recovers."""
+        waits = []
+        if self._sent_at:
+            waits.append(self._sent_at[0] + RATE_LIMIT_WINDOW - now)
+        if now < self._reported_reset_at:
+            waits.append(self._reported_reset_at - now)
+        return max(min(waits), 0.0) if waits else 0.0
+
+
+class CredentialPool:
+    """The `CredentialPool` class spreads the OpenAI requests across several API keys
+    and/or organizations, so that the throughput is not capped by the rate limit of a
+    single API key. Every request goes to the healthy credential with the fewest
+    in-flight requests, or the least recently used one on ties, and the credentials
+    that get rate limited (HTTP 429) are temporarily drained with an exponential
+    backoff. The remaining quota of each credential is tracked from the
+    `requests_per_minute`, if provided, and from the `x-ratelimit-*` headers, which
+    the `openai` client only exposes on errors. The pool is thread-safe and can
+    also be used from asyncio code, as its lock is never held while waiting.
+
+    Note that the files and fine-tuned models are owned by either an organization,
+    or the account of an API key without organization, so the requests for those are
+    just routed to the credentials of their owner. The fine-tuned models can be
+    registered via `register_model` or `register_fine_tunes`, otherwise those are
+    looked up on their first request whenever the pool spans several owners.
+
+    Args:
+        credentials: the credentials to use, either as `Credential` objects, API keys,
+            or `(api_key, organization)` tuples.
+        cooldown: the seconds a credential is drained after its first rate limit,
+            doubled on every consecutive rate limit. Defaults to 1.0.
+        max_cooldown: the maximum seconds a credential is drained. Defaults to 60.0.
+        max_attempts: the maximum number of attempts per request before raising the
+            `RateLimitError`. Defaults to the number of credentials plus one.
+
+    Attributes:
+        credentials: the credentials in the pool.
+        cooldown: the seconds a credential is drained after its first rate limit.
+        max_cooldown: the maximum seconds a credential is drained.
+        max_attempts: the maximum number of attempts per request.
+        models: the mapping from the fine-tuned models to their owner, as
+            `(organization, api_key)` tuples.
+
+    Examples:
+        >>> from opentrain import CredentialPool, Inference
+        >>> pool = CredentialPool([("sk-1234", "org-1234"), ("sk-5678", "org-5678")])
+        >>> pool.register_fine_tunes()
+        >>> inference = Inference(model="curie:ft-personal-<DATE>", pool=pool)
+        >>> inference(prompt="This is a sample prompt.")
+        'This is a sample completion.'
+    """
+
+    def __init__(
+        self,
+        credentials: List[Union[Credential, str, tuple]],
+        cooldown: float = 1.0,
+        max_cooldown: float = 60.0,
+        max_attempts: Union[int, None] = None,
+    ) -> None:
+        """Initializes the `CredentialPool` class.
+
+        Args:
+            credentials: the credentials to use, either as `Credential` objects, API
+                keys, or `(api_key, organization)` tuples.
+            cooldown: the seconds a credential is drained after its first rate limit,
+                doubled on every consecutive rate limit. Defaults to 1.0.
+            max_cooldown: the maximum seconds a credential is drained. Defaults to
+                60.0.
+            max_attempts: the maximum number of attempts per request before raising
+                the `RateLimitError`. Defaults to the number of credentials plus one.
+        """
+        if not credentials:
+            raise ValueError("You must provide at least one credential to the pool.")
+        self.credentials = [
+            credential
+            if isinstance(credential, Credential)
+            else Credential(api_key=credential)
+            if isinstance(credential, str)
+            else Credential(*credential)
+            for credential in credentials
+        ]
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_attempts = max_attempts or len(self.credentials) + 1
+        self.models: Dict[str, Owner] = {}
+        self._lock = threading.Lock()
+        self._registering = threading.Lock()
+        self._uses = itertools.count()
+
+    @property
+    def owners(self) -> List[Owner]:
+        """Returns the unique owners of the credentials in the pool, as
+        `(organization, api_key)` tuples, where the API key is just set for the
+        credentials without organization."""
+        return list(
+            dict.fromkeys(
+                (c.organization, None) if c.organization else (None, c.api_key)
+                for c in self.credentials
+            )
+        )
+
+    def register_model(
+        self,
+        model: str,
+        organization: Union[str, None] = None,
+        api_key: Union[str, None] = None,
+    ) -> None:
+        """Registers the owner of a fine-tuned model, so that its requests are just
+        routed to the owner's credentials.
+
+        Args:
+            model: the name of the fine-tuned model.
+            organization: the OpenAI organization ID that owns the model. Defaults to
+                None.
+            api_key: the OpenAI API key that owns the model, if it's not owned by an
+                organization. Defaults to None.
+        """
+        if organization is None and api_key is None:
+            raise ValueError(
+                "You must provide either the `organization` or the `api_key` that owns"
+                f" the model {model}."
+            )
+        with self._lock:
+            self.models[model] = (organization, api_key)
+
+    def register_fine_tunes(self) -> None:
+        """Registers all the fine-tuned models of every owner in the pool."""
+        for organization, api_key in self.owners:
+            for fine_tune in self.request(
+                openai.FineTune.list, organization=organization, api_key=api_key
+            )["data"]:
+                if fine_tune["fine_tuned_model"]:
+                    self.register_model(
+                        fine_tune["fine_tuned_model"], organization, api_key
+                    )
+
+    def _choose(
+        self, organization: Union[str, None], api_key: Union[str, None], now: float
+    ) -> Union[Credential, float]:
+        """Chooses the least loaded healthy credential, or returns the seconds to wait
+        until one of them is available. Must be called while holding the lock."""
+        candidates = [
+            c
+            for c in self.credentials
+            if (organization is None or c.organization == organization)
+            and (api_key is None or c.api_key == api_key)
+        ]
+        if not candidates:
+            raise ValueError(
+                "There are no credentials in the pool for the organization"
+                f" {organization}"
+                + (" and the given API key." if api_key is not None else ".")
+            )
+        available, wait = [], float("inf")
+        for credential in candidates:
+            remaining = credential.remaining_requests(now)
+            if credential.drained_until > now:
+                wait = min(wait, credential.drained_until - now)
+            elif remaining is not None and remaining <= 0:
+                wait = min(wait, credential.recovers_in(now))
+            else:
+                available.append(
+                    (
+                        credential.in_flight,
+                        -(remaining or 0),
+                        credential.last_used,
+                        credential,
+                    )
+                )
+        if not available:
+            return wait
+        # Ties are broken by picking the least recently used credential
+        return min(available, key=lambda item: item[:3])[3]
+
+    def _select(
+        self, organization: Union[str, None], api_key: Union[str, None]
+    ) -> Union[Credential, float]:
+        """Selects the least loaded healthy credential and marks it as in-flight, or
+        returns the seconds to wait until one of them is available."""
+        now = time.monotonic()
+        with self._lock:
+            credential = self._choose(organization, api_key, now)
+            if isinstance(credential, Credential):
+                credential.in_flight += 1
+                credential.last_used = next(self._uses)
+                credential._sent_at.append(now)
+            return credential
+
+    def owner_for(self, organization: Union[str, None] = None) -> Owner:
+        """Resolves the owner of a new resource, e.g. an uploaded file, so that all
+        the later requests for it can be pinned to it. The owner is the organization
+        of the least loaded healthy credential, or its API key if it has no
+        organization, as the resource then belongs to the API key's account.
+
+        Args:
+            organization: the OpenAI organization ID, if already known. Defaults to
+                None, meaning the owner of the least loaded healthy credential.
+
+        Returns:
+            The owner as an `(organization, api_key)` tuple.
+        """
+        if organization is not None:
+            return organization, None
+        with self._lock:
+            credential = self._choose(None, None, time.monotonic())
+            if not isinstance(credential, Credential):
+                # All the credentials are drained, so pick the one recovering first
+                credential = min(self.credentials, key=lambda c: c.drained_until)
+            if credential.organization:
+                return credential.organization, None
+            return None, credential.api_key
+
+    def _release(self, credential: Credential) -> None:
+        with self._lock:
+            credential.in_flight -= 1
+
+    @contextmanager
+    def acquire(
+        self, organization: Union[str, None] = None, api_key: Union[str, None] = None
+    ) -> Iterator[Credential]:
+        """Acquires a credential from the pool, blocking until one is available.
+
+        Args:
+            organization: the OpenAI organization ID the credential must belong to.
+                Defaults to None, meaning any credential.
+            api_key: the OpenAI API key of the credential. Defaults to None, meaning
+                any credential.
+
+        Yields:
+            The acquired `Credential`.
+        """
+        credential = self._select(organization, api_key)
+        while not isinstance(credential, Credential):
+            time.sleep(credential)
+            credential = self._select(organization, api_key)
+        try:
+            yield credential
+        finally:
+            self._release(credential)
+
+    @asynccontextmanager
+    async def aacquire(
+        self, organization: Union[str, None] = None, api_key: Union[str, None] = None
+    ) -> AsyncIterator[Credential]:
+        """Acquires a credential from the pool, awaiting until one is available.
+
+        Args:
+            organization: the OpenAI organization ID the credential must belong to.
+                Defaults to None, meaning any credential.
+            api_key: the OpenAI API key of the credential. Defaults to None, meaning
+                any credential.
+
+        Yields:
+            The acquired `Credential`.
+        """
+        credential = self._select(organization, api_key)
+        while not isinstance(credential, Credential):
+            await asyncio.sleep(credential)
+            credential = self._select(organization, api_key)
+        try:
+            yield credential
+        finally:
+            self._release(credential)
+
+    def report_success(self, credential: Credential) -> None:
+        """Marks the credential as healthy after a successful request."""
+        with self._lock:
+            credential.rate_limits = 0
+
+    def report_headers(self, credential: Credential, headers: Dict[str, str]) -> None:
+        """Tracks the remaining quota of the credential from the `x-ratelimit-*`
+        headers sent by OpenAI, draining it until the reset if it's exhausted.
+
+        Args:
+            credential: the credential used for the request.
+            headers: the headers of OpenAI's response.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for kind in ("requests", "tokens"):
+                try:
+                    remaining = int(headers[f"x-ratelimit-remaining-{kind}"])
+                    reset_in = _parse_duration(headers[f"x-ratelimit-reset-{kind}"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if kind == "requests":
+                    credential._reported_remaining = remaining
+                    credential._reported_at = now
+                    credential._reported_reset_at = now + reset_in
+                if remaining <= 0:
+                    credential.drained_until = max(
+                        credential.drained_until, now + reset_in
+                    )
+
+    def report_rate_limit(
+        self, credential: Credential, error: Union[RateLimitError, None] = None
+    ) -> None:
+        """Drains the credential after a rate limit, either for the seconds suggested
+        by OpenAI in the `retry-after` header, or with an exponential backoff.
+
+        Args:
+            credential: the rate limited credential.
+            error: the `RateLimitError` raised by OpenAI. Defaults to None.
+        """
+        headers = getattr(error, "headers", None) or {}
+        self.report_headers(credential, headers)
+        with self._lock:
+            credential.rate_limits += 1
+            try:
+                cooldown = float(headers["retry-after"])
+            except (KeyError, TypeError, ValueError):
+                cooldown = min(
+                    self.cooldown * 2 ** (credential.rate_limits - 1),
+                    self.max_cooldown,
+                )
+            credential.drained_until = max(
+                credential.drained_until, time.monotonic() + cooldown
+            )
+
+    def _is_unregistered(self, model: Union[str, None]) -> bool:
+        """Returns whether the model is a fine-tuned one whose owner is unknown, while
+        the pool spans several owners, so that it can't be routed to any credential.
+        """
+        # The fine-tuned models are named e.g. `curie:ft-personal-<DATE>`
+        return (
+            model is not None
+            and (":ft-" in model or model.startswith("ft:"))
+            and model not in self.models
+            and len(self.owners) > 1
+        )
+
+    def _register_unregistered(self, model: Union[str, None]) -> None:
+        """Looks up the owner of an unregistered fine-tuned model, just once even if
+        several requests for it are sent concurrently."""
+        if not self._is_unregistered(model):
+            return
+        with self._registering:
+            if self._is_unregistered(model):
+                self.register_fine_tunes()
+
+    def _resolve(
+        self, organization: Union[str, None], api_key: Union[str, None], **kwargs
+    ) -> Owner:
+        if organization is not None or api_key is not None:
+            return organization, api_key
+        model = kwargs.get("model")
+        if self._is_unregistered(model):
+            raise ValueError(
+                f"The fine-tuned model {model} is not owned by any of the credentials"
+                " in the pool."
+            )
+        return self.models.get(model, (None, None))
+
+    def request(
+        self,
+        fn: Callable[..., Any],
+        organization: Union[str, None] = None,
+        api_key: Union[str, None] = None,
+        **kwargs,
+    ) -> Any:
+        """Calls an OpenAI API function with a credential from the pool, retrying with
+        another credential whenever it gets rate limited.
+
+        Args:
+            fn: the OpenAI API function, e.g. `openai.Completion.create`.
+            organization: the OpenAI organization ID the credential must belong to.
+                Defaults to None, meaning the owner of the `model` if it's a
+                fine-tuned one, or any credential otherwise.
+            api_key: the OpenAI API key of the credential, for the resources owned by
+                an API key without organization. Defaults to None.
+            **kwargs: the keyword arguments to pass to `fn`.
+
+        Returns:
+            The response of `fn`.
+
+        Raises:
+            ValueError: if the `model` is a fine-tuned one not owned by any of the
+                credentials in the pool.
+        """
+        if organization is None and api_key is None:
+            self._register_unregistered(kwargs.get("model"))
+        organization, api_key = self._resolve(organization, api_key, **kwargs)
+        for attempt in range(1, self.max_attempts + 1):
+            with self.acquire(organization, api_key) as credential:
+                try:
+                    response = fn(
+                        api_key=credential.api_key,
+                        organization=credential.organization,
+                        **kwargs,
+                    )
+                except RateLimitError as e:
+                    self.report_rate_limit(credential, e)
+                    if attempt == self.max_attempts:
+                        raise
+                    continue
+                except OpenAIError as e:
+                    self.report_headers(credential, e.headers)
+                    raise
+                self.report_success(credential)
+                return response
+
+    async def arequest(
+        self,
+        fn: Callable[..., Any],
+        organization: Union[str, None] = None,
+        api_key: Union[str, None] = None,
+        **kwargs,
+    ) -> Any:
+        """Awaits an async OpenAI API function with a credential from the pool,
+        retrying with another credential whenever it gets rate limited.
+
+        Args:
+            fn: the async OpenAI API function, e.g. `openai.Completion.acreate`.
+            organization: the OpenAI organization ID the credential must belong to.
+                Defaults to None, meaning the owner of the `model` if it's a
+                fine-tuned one, or any credential otherwise.
+            api_key: the OpenAI API key of the credential, for the resources owned by
+                an API key without organization. Defaults to None.
+            **kwargs: the keyword arguments to pass to `fn`.
+
+        Returns:
+            The response of `fn`.
+
+        Raises:
+            ValueError: if the `model` is a fine-tuned one not owned by any of the
+                credentials in the pool.
+        """
+        if (
+            organization is None
+            and api_key is None
+            and self._is_unregistered(kwargs.get("model"))
+        ):
+            # Look up the owner without blocking the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._register_unregistered, kwargs.get("model")
+            )
+        organization, api_key = self._resolve(organization, api_key, **kwargs)
+        for attempt in range(1, self.max_attempts + 1):
+            async with self.aacquire(organization, api_key) as credential:
+                try:
+                    response = await fn(
+                        api_key=credential.api_key,
+                        organization=credential.organization,
+                        **kwargs,
+                    )
+                except RateLimitError as e:
+                    self.report_rate_limit(credential, e)
+                    if attempt == self.max_attempts:
+                        raise
+                    continue
+                except OpenAIError as e:
+                    self.report_headers(credential, e.headers)
+                    raise
+                self.report_success(credential)
+                return response
+
+
+def request(
+    fn: Callable[..., Any],
+    pool: Union[CredentialPool, None] = None,
+    organization: Union[str, None] = None,
+    api_key: Union[str, None] = None,
+    **kwargs,
+) -> Any:
+    """Calls an OpenAI API function either through the `CredentialPool`, if any, or
+    with the globally defined `openai.api_key` otherwise.
+
+    Args:
+        fn: the OpenAI API function, e.g. `openai.File.create`.
+        pool: the `CredentialPool` to use. Defaults to None.
+        organization: the OpenAI organization name. Defaults to None.
+        api_key: the OpenAI API key to use, for the resources owned by an API key
+            without organization. Defaults to None, meaning the global one or any
+            credential in the pool.
+        **kwargs: the keyword arguments to pass to `fn`.
+
+    Returns:
+        The response of `fn`.
+    """
+    if pool is None:
+        if api_key is not None:
+            kwargs["api_key"] = api_key
+        return fn(organization=organization, **kwargs)
+    return pool.request(fn, organization=organization, api_key=api_key, **kwargs)
@@ -3,12 +3,15 @@ import warnings
 from functools import cached_property
 from pathlib import Path
 from time import sleep
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, Iterable, List, Union
 from uuid import uuid4
 
 import openai
 from openai.error import TryAgain
 
+from opentrain.credentials import CredentialPool, request
+from opentrain.dedup import Deduplicator
+
 FILE_SIZE_WARNING = 500 * 1024 * 1024
 
 
@@ -19,11 +22,19 @@ class Dataset:
     Args:
         file_id: the ID of the file previously uploaded to OpenAI.
         organization: the OpenAI organization name. Defaults to None.
+        pool: the `CredentialPool` to spread the requests across. Defaults to None,
+            meaning that the global `openai.api_key` is used.
+        api_key: the OpenAI API key that owns the file, if it's not owned by an
+            organization. Defaults to None.
 
     Attributes:
         file_id: the ID of the file previously uploaded to OpenAI.
         organization: the OpenAI organization name.
+        pool: the `CredentialPool` to spread the requests across, if any.
+        api_key: the OpenAI API key that owns the file, if any.
         info: the information of the file.
+        deduplication_report: the `DeduplicationReport` if the dataset was
+            deduplicated before being uploaded, otherwise None.
 
     Examples:
         >>> from opentrain import Dataset
@@ -33,15 +44,28 @@ class Dataset:
         >>> dataset.delete()
     """
 
-    def __init__(self, file_id: str, organization: Union[str, None] = None) -> None:
+    def __init__(
+        self,
+        file_id: str,
+        organization: Union[str, None] = None,
+        pool: Union[CredentialPool, None] = None,
+        api_key: Union[str, None] = None,
+    ) -> None:
         """Initializes the `Dataset` class.
 
         Args:
             file_id: the ID of the file previously uploaded to OpenAI.
             organization: the OpenAI organization name. Defaults to None.
+            pool: the `CredentialPool` to spread the requests across. Defaults to
+                None, meaning that the global `openai.api_key` is used.
+            api_key: the OpenAI API key that owns the file, if it's not owned by an
+                organization. Defaults to None.
         """
         self.file_id = file_id
         self.organization = organization
+        self.pool = pool
+        self.api_key = api_key
+        self.deduplication_report = None
 
     @cached_property
     def info(self) -> Dict[str, Any]:
@@ -50,7 +74,13 @@ class Dataset:
         Returns:
             A dictionary with the information of the file.
         """
-        return openai.File.retrieve(id=self.file_id, organization=self.organization)
+        return request(
+            openai.File.retrieve,
+            pool=self.pool,
+            organization=self.organization,
+            api_key=self.api_key,
+            id=self.file_id,
+        )
 
     def download(self) -> bytes:
         """Downloads the file from OpenAI.
@@ -63,7 +93,13 @@ class Dataset:
             " mind that this will fail if you're using a free tier.",
             stacklevel=2,
         )
-        return openai.File.download(id=self.file_id, organization=self.organization)
+        return request(
+            openai.File.download,
+            pool=self.pool,
+            organization=self.organization,
+            api_key=self.api_key,
+            id=self.file_id,
+        )
 
     def to_file(self, output_path: str) -> None:
         """Downloads the file from OpenAI and saves it to the specified path.
@@ -81,8 +117,13 @@ class Dataset:
         file_deleted = False
         while file_deleted is False:
             try:
-                openai.File.delete(
-                    sid=self.file_id, organization=self.organization, request_timeout=10
+                request(
+                    openai.File.delete,
+                    pool=self.pool,
+                    organization=self.organization,
+                    api_key=self.api_key,
+                    sid=self.file_id,
+                    request_timeout=10,
                 )
                 file_deleted = True
             except TryAgain:
@@ -94,6 +135,8 @@ class Dataset:
         file_path: str,
         file_name: Union[str, None] = None,
         organization: Union[str, None] = None,
+        deduplicate: Union[bool, Deduplicator] = False,
+        pool: Union[CredentialPool, None] = None,
     ) -> "Dataset":
         """Uploads a file to OpenAI and returns a `Dataset` object.
 
@@ -101,37 +144,80 @@ class Dataset:
             file_path: the path of the file to be uploaded.
             file_name: the name of the file to be defined in OpenAI. Defaults to None.
             organization: the OpenAI organization name. Defaults to None.
+            deduplicate: whether to remove the near-duplicate records before uploading
+                the file, or the `Deduplicator` to use for it. Defaults to False.
+            pool: the `CredentialPool` to spread the requests across. Defaults to
+                None, meaning that the global `openai.api_key` is used. If no
+                `organization` is provided, the file is pinned to the owner of the
+                least loaded credential, i.e. its organization or API key.
 
         Returns:
             A `Dataset` object.
         """
-        upload_response = openai.File.create(
-            file=open(file_path, "rb"),
+        if deduplicate:
+            with open(file_path, "r") as f:
+                return cls.from_records(
+                    records=(json.loads(line) for line in f if line.strip()),
+                    file_name=file_name,
+                    organization=organization,
+                    deduplicate=deduplicate,
+                    pool=pool,
+                )
+
+        api_key = None
+        if pool is not None:
+            # Files belong to their owner, so pin the upload and later requests
+            organization, api_key = pool.owner_for(organization)
+        upload_response = request(
+            # The file is re-opened on every attempt, as it's consumed on upload
+            lambda **kwargs: openai.File.create(file=open(file_path, "rb"), **kwargs),
+            pool=pool,
             organization=organization,
+            api_key=api_key,
             purpose="fine-tune",
             user_provided_filename=file_name,
         )
-        return cls(file_id=upload_response.id, organization=organization)
+        return cls(
+            file_id=upload_response.id,
+            organization=organization,
+            pool=pool,
+            api_key=api_key,
+        )
 
     @classmethod
     def from_records(
         cls,
-        records: List[Dict[str, str]],
+        records: Iterable[Dict[str, str]],
         file_name: Union[str, None] = None,
         organization: Union[str, None] = None,
+        deduplicate: Union[bool, Deduplicator] = False,
+        pool: Union[CredentialPool, None] = None,
     ) -> "Dataset":
         """Uploads a list of records to OpenAI and returns a `Dataset` object. Note
         that this function saves it first to a local file and then uploads it to
         OpenAI.
 
         Args:
-            records: a list of dictionaries with the records to be uploaded.
+            records: an iterable of dictionaries with the records to be uploaded.
             file_name: the name of the file to be defined in OpenAI. Defaults to None.
             organization: the OpenAI organization name. Defaults to None.
+            deduplicate: whether to remove the near-duplicate records before uploading
+                them, or the `Deduplicator` to use for it. Defaults to False.
+            pool: the `CredentialPool` to spread the requests across. Defaults to
+                None, meaning that the global `openai.api_key` is used. If no
+                `organization` is provided, the file is pinned to the owner of the
+                least loaded credential, i.e. its organization or API key.
 
         Returns:
             A `Dataset` object.
         """
+        deduplicator = None
+        if deduplicate:
+            deduplicator = (
+                deduplicate if isinstance(deduplicate, Deduplicator) else Deduplicator()
+            )
+            records = deduplicator.deduplicate(records)
+
         local_path = (
             Path.home() / ".cache" / "opentrain" / f"{file_name or uuid4()}.jsonl"
         )
@@ -153,13 +239,29 @@ class Dataset:
                 stacklevel=2,
             )
 
-        upload_response = openai.File.create(
-            file=open(local_path.as_posix(), "rb"),
+        api_key = None
+        if pool is not None:
+            # Files belong to their owner, so pin the upload and later requests
+            organization, api_key = pool.owner_for(organization)
+        upload_response = request(
+            lambda **kwargs: openai.File.create(
+                file=open(local_path.as_posix(), "rb"), **kwargs
+            ),
+            pool=pool,
             organization=organization,
+            api_key=api_key,
             purpose="fine-tune",
             user_provided_filename=file_name,
         )
-        return cls(file_id=upload_response.id, organization=organization)
+        dataset = cls(
+            file_id=upload_response.id,
+            organization=organization,
+            pool=pool,
+            api_key=api_key,
+        )
+        if deduplicator:
+            dataset.deduplication_report = deduplicator.report
+        return dataset
 
 
 class File(Dataset):
@@ -169,32 +271,62 @@ class File(Dataset):
     pass
 
 
-def list_datasets(organization: Union[str, None] = None) -> List[Dataset]:
+def _list_files(
+    cls: type, organization: Union[str, None], pool: Union[CredentialPool, None]
+) -> List[Dataset]:
+    owners = (
+        pool.owners
+        if pool is not None and organization is None
+        else [(organization, None)]
+    )
+    datasets = {}
+    for organization, api_key in owners:
+        for file in request(
+            openai.File.list, pool=pool, organization=organization, api_key=api_key
+        )["data"]:
+            # Several API keys without organization may belong to the same account
+            datasets.setdefault(
+                file["id"],
+                cls(
+                    file_id=file["id"],
+                    organization=organization,
+                    pool=pool,
+                    api_key=api_key,
+                ),
+            )
+    return list(datasets.values())
+
+
+def list_datasets(
+    organization: Union[str, None] = None, pool: Union[CredentialPool, None] = None
+) -> List[Dataset]:
     """Lists the datasets uploaded to your OpenAI or your organization's account.
 
     Args:
         organization: the OpenAI organization name. Defaults to None.
+        pool: the `CredentialPool` to spread the requests across. Defaults to None,
+            meaning that the global `openai.api_key` is used. If no `organization` is
+            provided, the files of every owner in the pool are listed.
 
     Returns:
         A list of `Dataset` objects.
     """
-    return [
-        Dataset(file_id=file["id"], organization=organization)
-        for file in openai.File.list(organization=organization)["data"]
-    ]
+    return _list_files(Dataset, organization=organization, pool=pool)
 
 
-def list_files(organization: Union[str, None] = None) -> List[File]:
+def list_files(
+    organization: Union[str, None] = None, pool: Union[CredentialPool, None] = None
+) -> List[File]:
     """This function is just a wrapper around `list_datasets` with the same
     functionality. It's just here to keep the same naming convention as OpenAI.
 
     Args:
         organization: the OpenAI organization name. Defaults to None.
+        pool: the `CredentialPool` to spread the requests across. Defaults to None,
+            meaning that the global `openai.api_key` is used. If no `organization` is
+            provided, the files of every owner in the pool are listed.
 
     Returns:
         A list of `File` objects.
     """
-    return [
-        File(file_id=file["id"], organization=organization)
-        for file in openai.File.list(organization=organization)["data"]
-    ]
+    return _list_files(File, organization=organization, pool=pool)
@@ -0,0 +1,263 @@
+import json
+import re
+import tempfile
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from opentrain.utils import estimate_num_tokens, imap_bounded
+
+try:
+    import numpy as np
+
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+# Mersenne prime 2^31 - 1, so that `a * h + b` never overflows an unsigned 64-bit int
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+@dataclass
+class DeduplicationReport:
+    num_records: int = 0
+    num_duplicates: int = 0
+    bytes_saved: int = 0
+    tokens_saved: int = 0
+
+
+def _optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Finds the number of bands and rows per band of the LSH index that minimize the
+    sum of the false positive and false negative probabilities for a given Jaccard
+    similarity threshold."""
+    below = np.linspace(0.0, threshold, 100)
+    above = np.linspace(threshold, 1.0, 100)
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positive = np.mean(1 - (1 - below**rows) ** bands) * threshold
+            false_negative = np.mean((1 - above**rows) ** bands) * (1 - threshold)
+            if false_positive + false_negative < best_error:
+                best, best_error = (bands, rows), false_positive + false_negative
+    return best
+
+
+def _shingles(record: Dict[str, str], shingle_size: int) -> List[bytes]:
+    text = " ".join(
+        re.sub(r"\s+", " ", record.get(key, "")).strip().lower()
+        for key in ("prompt", "completion")
+    ).encode("utf-8")
+    if len(text) <= shingle_size:
+        return [text]
+    return [text[i : i + shingle_size] for i in range(len(text) - shingle_size + 1)]
+
+
+def _band_hashes(
+    records: List[Dict[str, str]],
+    shingle_size: int,
+    permutations: "np.ndarray",
+    bands: int,
+    rows: int,
+) -> "np.ndarray":
+    """Computes the MinHash signature of every record, and then hashes each of its
+    bands into a single unsigned 64-bit integer."""
+    a, b = permutations[:, :1], permutations[:, 1:]
+    signatures = np.empty((len(records), len(permutations)), dtype=np.uint64)
+    for idx, record in enumerate(records):
+        hashes = np.fromiter(
+            (zlib.crc32(shingle) for shingle in _shingles(record, shingle_size)),
+            dtype=np.uint64,
+        ) % np.uint64(_MERSENNE_PRIME)
+        signatures[idx] = ((a * hashes[None, :] + b) % np.uint64(_MERSENNE_PRIME)).min(
+            axis=1
+        )
+    # Polynomial rolling hash over the rows of each band, wrapping around 2^64
+    weights = np.uint64(1_000_003) ** np.arange(rows, dtype=np.uint64)
+    return (
+        signatures[:, : bands * rows].reshape(len(records), bands, rows) * weights
+    ).sum(axis=2, dtype=np.uint64)
+
+
+class Deduplicator:
+    """The `Deduplicator` class removes the near-duplicate records of a training
+    corpus using MinHash signatures over the character shingles of both the prompt
+    and the completion, and LSH banding to find the near-duplicates in sub-quadratic
+    time. The first record of every near-duplicate cluster is kept.
+
+    The records are streamed, so the memory usage doesn't depend on the size of the
+    records, but just on a few fixed-width integers per record, which makes it
+    suitable for corpora with tens of millions of records.
+
+    Args:
+        threshold: the estimated Jaccard similarity above which two records are
+            considered near-duplicates. Defaults to 0.8.
+        num_perm: the number of permutations of the MinHash signatures. Defaults to
+            128.
+        shingle_size: the number of characters per shingle. Defaults to 5.
+        num_workers: the number of processes used to compute the MinHash signatures.
+            Defaults to 1.
+        chunk_size: the number of records sent to each worker at once. Defaults to
+            10000.
+        seed: the seed used to generate the MinHash permutations. Defaults to 42.
+
+    Attributes:
+        threshold: the Jaccard similarity threshold.
+        num_perm: the number of permutations of the MinHash signatures.
+        shingle_size: the number of characters per shingle.
+        num_workers: the number of processes used to compute the MinHash signatures.
+        chunk_size: the number of records sent to each worker at once.
+        bands: the number of bands of the LSH index.
+        rows: the number of rows per band of the LSH index.
+        report: the `DeduplicationReport` of the last deduplication, available once
+            the deduplicated stream has been fully consumed.
+
+    Examples:
+        >>> from opentrain.dedup import Deduplicator
+        >>> deduplicator = Deduplicator(threshold=0.8, num_workers=4)
+        >>> records = list(deduplicator.deduplicate(records))
+        >>> deduplicator.report
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        shingle_size: int = 5,
+        num_workers: int = 1,
+        chunk_size: int = 10_000,
+        seed: int = 42,
+    ) -> None:
+        """Initializes the `Deduplicator` class.
+
+        Args:
+            threshold: the estimated Jaccard similarity above which two records are
+                considered near-duplicates. Defaults to 0.8.
+            num_perm: the number of permutations of the MinHash signatures. Defaults
+                to 128.
+            shingle_size: the number of characters per shingle. Defaults to 5.
+            num_workers: the number of processes used to compute the MinHash
+                signatures. Defaults to 1.
+            chunk_size: the number of records sent to each worker at once. Defaults
+                to 10000.
+            seed: the seed used to generate the MinHash permutations. Defaults to 42.
+        """
+        if not has_numpy:
+            raise ImportError(
+                "`numpy` is required to use the `Deduplicator`, please install it via"
+                " `pip install opentrain[dedup]`."
+            )
+        assert 0.0 < threshold < 1.0, "The `threshold` must be between 0 and 1."
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self.bands, self.rows = _optimal_bands(threshold, num_perm)
+
+        generator = np.random.RandomState(seed)
+        self._permutations = np.stack(
+            [
+                generator.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64),
+                generator.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64),
+            ],
+            axis=1,
+        )
+        self.report = None
+
+    def _chunks(
+        self, records: Iterable[Dict[str, str]], spool
+    ) -> Iterator[List[Dict[str, str]]]:
+        chunk = []
+        for record in records:
+            json.dump(record, spool)
+            spool.write("\n")
+            chunk.append(record)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _write_band_hashes(
+        self, records: Iterable[Dict[str, str]], spool, band_files: List[Path]
+    ) -> int:
+        num_records = 0
+        for band_hashes in imap_bounded(
+            _band_hashes,
+            self._chunks(records, spool),
+            self.num_workers,
+            self.shingle_size,
+            self._permutations,
+            self.bands,
+            self.rows,
+        ):
+            for band, band_file in enumerate(band_files):
+                with open(band_file.as_posix(), "ab") as f:
+                    np.ascontiguousarray(band_hashes[:, band]).tofile(f)
+            num_records += len(band_hashes)
+        return num_records
+
+    def deduplicate(
+        self, records: Iterable[Dict[str, str]]
+    ) -> Iterator[Dict[str, str]]:
+        """Removes the near-duplicate records, keeping the first record of every
+        near-duplicate cluster. Note that the records are consumed just once, as
+        those are spooled to a temporary file while computing the signatures.
+
+        Args:
+            records: an iterable of records with a `prompt` and a `completion`.
+
+        Yields:
+            The deduplicated records, in their original order.
+        """
+        with tempfile.TemporaryDirectory(prefix="opentrain-dedup-") as tmp_dir:
+            spool_path = Path(tmp_dir) / "records.jsonl"
+            band_files = [
+                Path(tmp_dir) / f"band-{band}.bin" for band in range(self.bands)
+            ]
+
+            with open(spool_path.as_posix(), "w") as spool:
+                num_records = self._write_band_hashes(records, spool, band_files)
+
+            # A record is a near-duplicate if it shares any LSH bucket with a
+            # previous record, i.e. if it's not the first of its bucket in any band
+            is_duplicate = np.zeros(num_records, dtype=bool)
+            for band_file in band_files if num_records else []:
+                keys = np.fromfile(band_file.as_posix(), dtype=np.uint64)
+                order = np.argsort(keys, kind="stable")
+                sorted_keys = keys[order]
+                is_duplicate[order[1:][sorted_keys[1:] == sorted_keys[:-1]]] = True
+                del keys, order, sorted_keys
+
+            report = DeduplicationReport(num_records=num_records)
+            with open(spool_path.as_posix(), "r") as spool:
+                for idx, line in enumerate(spool):
+                    record = json.loads(line)
+                    if not is_duplicate[idx]:
+                        yield record
+                        continue
+                    report.num_duplicates += 1
+                    report.bytes_saved += len(line.encode("utf-8"))
+                    report.tokens_saved += estimate_num_tokens(
+                        record.get("prompt", "") + record.get("completion", "")
+                    )
+            self.report = report
+
+
+def deduplicate(
+    records: Iterable[Dict[str, str]], **kwargs
+) -> Tuple[List[Dict[str, str]], DeduplicationReport]:
+    """Removes the near-duplicate records of a training corpus. This function is just
+    a wrapper around `Deduplicator` that returns both the records and the report.
+
+    Args:
+        records: an iterable of records with a `prompt` and a `completion`.
+        **kwargs: the keyword arguments to pass to the `Deduplicator`.
+
+    Returns:
+        A tuple with the deduplicated records and the `DeduplicationReport`.
+    """
+    deduplicator = Deduplicator(**kwargs)
+    records = list(deduplicator.deduplicate(records))
+    return records, deduplicator.report
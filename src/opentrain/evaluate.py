@@ -0,0 +1,303 @@
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+from opentrain.credentials import CredentialPool
+from opentrain.dataset import Dataset
+from opentrain.inference import Inference
+
+try:
+    import numpy as np
+
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+EvalDatasetType = Union[str, Dataset, List[Dict[str, str]]]
+
+PREDICTIONS_CACHE_DIR = Path.home() / ".cache" / "opentrain" / "predictions"
+
+
+def compute_metrics(references: List[str], predictions: List[str]) -> Dict[str, Any]:
+    """Computes the classification metrics for a list of predictions against its
+    references. Both accuracy, macro-F1 and the confusion matrix are computed over
+    the whitespace-stripped labels, while exact-match compares the raw strings.
+
+    Args:
+        references: the expected completions.
+        predictions: the completions generated by the model.
+
+    Returns:
+        A dictionary with the `accuracy`, `macro_f1`, `exact_match`, `labels`, and
+        `confusion_matrix` (rows are references and columns are predictions).
+
+    Raises:
+        ValueError: if there are no references, or the number of references and
+            predictions don't match.
+    """
+    if not has_numpy:
+        raise ImportError(
+            "`numpy` is required to compute the metrics, please install it via `pip"
+            " install opentrain[evaluate]`."
+        )
+    if not references:
+        raise ValueError(
+            "You must provide at least one reference to compute the metrics, but the"
+            " evaluation dataset is empty."
+        )
+    if len(references) != len(predictions):
+        raise ValueError(
+            f"The number of references ({len(references)}) and predictions"
+            f" ({len(predictions)}) must match."
+        )
+
+    raw_references = np.asarray(references, dtype=object)
+    raw_predictions = np.asarray(predictions, dtype=object)
+    exact_match = float(np.mean(raw_references == raw_predictions))
+
+    labels, encoded = np.unique(
+        np.concatenate(
+            [
+                np.char.strip(raw_references.astype(str)),
+                np.char.strip(raw_predictions.astype(str)),
+            ]
+        ),
+        return_inverse=True,
+    )
+    num_labels = len(labels)
+    y_true, y_pred = encoded[: len(references)], encoded[len(references) :]
+
+    confusion_matrix = np.bincount(
+        y_true * num_labels + y_pred, minlength=num_labels * num_labels
+    ).reshape(num_labels, num_labels)
+
+    true_positives = np.diag(confusion_matrix).astype(float)
+    predicted = confusion_matrix.sum(axis=0)
+    actual = confusion_matrix.sum(axis=1)
+    precision = np.divide(
+        true_positives,
+        predicted,
+        out=np.zeros_like(true_positives),
+        where=predicted > 0,
+    )
+    recall = np.divide(
+        true_positives, actual, out=np.zeros_like(true_positives), where=actual > 0
+    )
+    denominator = precision + recall
+    f1 = np.divide(
+        2 * precision * recall,
+        denominator,
+        out=np.zeros_like(true_positives),
+        where=denominator > 0,
+    )
+
+    return {
+        "accuracy": float(np.mean(y_true == y_pred)),
+        "macro_f1": float(f1.mean()),
+        "exact_match": exact_match,
+        "labels": labels.tolist(),
+        "confusion_matrix": confusion_matrix.tolist(),
+    }
+
+
+class Evaluator:
+    """The `Evaluator` class runs the inference of several OpenAI models over the same
+    evaluation dataset, and then compares them by computing the classification metrics
+    for each of those.
+
+    Args:
+        models: the names of the OpenAI models and/or the IDs of the OpenAI fine-tunes
+            to evaluate.
+        max_workers: the maximum number of concurrent requests shared among all the
+            models. Defaults to 8.
+        cache_dir: the directory where the predictions of each model are cached, so
+            that those are not generated again on reruns. Defaults to
+            `~/.cache/opentrain/predictions`.
+        pool: the `CredentialPool` to spread the requests across. Defaults to None,
+            meaning that the global `openai.api_key` is used.
+
+    Attributes:
+        models: the names of the OpenAI models to evaluate.
+        max_workers: the maximum number of concurrent requests shared among all the
+            models.
+        cache_dir: the directory where the predictions of each model are cached.
+        pool: the `CredentialPool` to spread the requests across, if any.
+        results: the metrics computed for each model, available after `evaluate`.
+
+    Examples:
+        >>> from opentrain import Evaluator
+        >>> evaluator = Evaluator(models=["curie:ft-personal-<DATE>", "ft-1234"])
+        >>> evaluator.evaluate("eval.jsonl", max_tokens=1)
+        >>> print(evaluator.table())
+    """
+
+    def __init__(
+        self,
+        models: List[str],
+        max_workers: int = 8,
+        cache_dir: Union[str, Path, None] = None,
+        pool: Union[CredentialPool, None] = None,
+    ) -> None:
+        """Initializes the `Evaluator` class.
+
+        Args:
+            models: the names of the OpenAI models and/or the IDs of the OpenAI
+                fine-tunes to evaluate.
+            max_workers: the maximum number of concurrent requests shared among all
+                the models. Defaults to 8.
+            cache_dir: the directory where the predictions of each model are cached.
+                Defaults to `~/.cache/opentrain/predictions`.
+            pool: the `CredentialPool` to spread the requests across. Defaults to
+                None, meaning that the global `openai.api_key` is used.
+        """
+        if not has_numpy:
+            raise ImportError(
+                "`numpy` is required to use the `Evaluator`, please install it via"
+                " `pip install opentrain[evaluate]`."
+            )
+        self.models = [
+            Inference.from_fine_tune_id(model, pool=pool).model
+            if model.startswith("ft-")
+            else model
+            for model in models
+        ]
+        self.max_workers = max_workers
+        self.cache_dir = Path(cache_dir) if cache_dir else PREDICTIONS_CACHE_DIR
+        self.pool = pool
+        self.results = None
+
+    def _load_records(self, dataset: EvalDatasetType) -> List[Dict[str, str]]:
+        if isinstance(dataset, list):
+            return dataset
+        if isinstance(dataset, Dataset):
+            lines = dataset.download().decode("utf-8").splitlines()
+        else:
+            with open(dataset, "r") as f:
+                lines = f.read().splitlines()
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def _cache_path(self, model: str, prompts: List[str], **kwargs) -> Path:
+        digest = hashlib.sha256(
+            json.dumps({"prompts": prompts, **kwargs}, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+        return (
+            self.cache_dir / f"{re.sub(r'[^A-Za-z0-9_.-]', '-', model)}-{digest}.json"
+        )
+
+    def _save(
+        self, model: str, prompts: List[str], predictions: List[str], **kwargs
+    ) -> None:
+        with open(self._cache_path(model, prompts, **kwargs), "w") as f:
+            json.dump(predictions, f)
+
+    def predict(self, dataset: EvalDatasetType, **kwargs) -> Dict[str, List[str]]:
+        """Generates the predictions of every model for the given dataset, running
+        all the requests concurrently within the same `max_workers` budget, and
+        reusing the cached predictions whenever available. The predictions are
+        cached per model as soon as those are completed, and the partial ones are
+        cached too if a request fails, so that a rerun just requests the missing
+        ones.
+
+        Args:
+            dataset: either a `Dataset`, the path to a local JSONL file, or a list of
+                records, each of those with a `prompt` and a `completion`.
+            **kwargs: the keyword arguments to pass to the OpenAI API. See
+                https://platform.openai.com/docs/api-reference/completions/create.
+
+        Returns:
+            A dictionary with the predictions for each model.
+        """
+        prompts = [record["prompt"] for record in self._load_records(dataset)]
+
+        predictions, missing = {}, {}
+        for model in self.models:
+            predictions[model] = [None] * len(prompts)
+            cache_path = self._cache_path(model, prompts, **kwargs)
+            if cache_path.exists():
+                with open(cache_path.as_posix(), "r") as f:
+                    predictions[model] = json.load(f)
+            indices = {idx for idx, p in enumerate(predictions[model]) if p is None}
+            if indices:
+                missing[model] = indices
+
+        if missing:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            inferences = {
+                model: Inference(model=model, pool=self.pool) for model in missing
+            }
+            remaining = {model: len(indices) for model, indices in missing.items()}
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # Interleave the requests so that all the models progress together
+                futures = {
+                    executor.submit(inferences[model], prompt, **kwargs): (model, idx)
+                    for idx, prompt in enumerate(prompts)
+                    for model, indices in missing.items()
+                    if idx in indices
+                }
+                try:
+                    for future in as_completed(futures):
+                        model, idx = futures[future]
+                        predictions[model][idx] = future.result()
+                        remaining[model] -= 1
+                        if remaining[model] == 0:
+                            self._save(model, prompts, predictions[model], **kwargs)
+                except BaseException:
+                    # Persist the partial predictions, so that a rerun just requests
+                    # the ones that are still missing
+                    for future in futures:
+                        future.cancel()
+                    for model in missing:
+                        if remaining[model] > 0:
+                            self._save(model, prompts, predictions[model], **kwargs)
+                    raise
+
+        return {model: predictions[model] for model in self.models}
+
+    def evaluate(self, dataset: EvalDatasetType, **kwargs) -> Dict[str, Dict[str, Any]]:
+        """Evaluates every model over the given dataset.
+
+        Args:
+            dataset: either a `Dataset`, the path to a local JSONL file, or a list of
+                records, each of those with a `prompt` and a `completion`.
+            **kwargs: the keyword arguments to pass to the OpenAI API. See
+                https://platform.openai.com/docs/api-reference/completions/create.
+
+        Returns:
+            A dictionary with the metrics computed for each model.
+        """
+        records = self._load_records(dataset)
+        references = [record["completion"] for record in records]
+        predictions = self.predict(records, **kwargs)
+        self.results = {
+            model: compute_metrics(references, model_predictions)
+            for model, model_predictions in predictions.items()
+        }
+        return self.results
+
+    def table(self) -> str:
+        """Returns a Markdown table comparing the metrics of every model.
+
+        Returns:
+            The comparison table as a Markdown string.
+
+        Raises:
+            ValueError: if the models haven't been evaluated yet.
+        """
+        if not self.results:
+            raise ValueError(
+                "You must call `evaluate` before `table`, since there's nothing to"
+                " compare as the models haven't been evaluated yet."
+            )
+        rows = [
+            "| model | accuracy | macro_f1 | exact_match |",
+            "| --- | --- | --- | --- |",
+        ]
+        for model, metrics in self.results.items():
+            rows.append(
+                f"| {model} | {metrics['accuracy']:.4f} | {metrics['macro_f1']:.4f} |"
+                f" {metrics['exact_match']:.4f} |"
+            )
+        return "\n".join(rows)
@@ -1,8 +1,11 @@
 import warnings
-from typing import List
+from functools import partial
+from typing import List, Union
 
 import openai
 
+from opentrain.credentials import CredentialPool, request
+from opentrain.resilience import Resilience
 from opentrain.schemas import FineTune
 
 warnings.simplefilter("once", category=UserWarning)
@@ -14,9 +17,17 @@ class Inference:
 
     Args:
         model: the name of the OpenAI model to use for the inference.
+        organization: the OpenAI organization that owns the model. Defaults to None.
+        pool: the `CredentialPool` to spread the requests across. Defaults to None,
+            meaning that the global `openai.api_key` is used.
+        resilience: the `Resilience` layer with the deadline, hedging, and circuit
+            breaker to use. Defaults to None, meaning a single blocking request.
 
     Attributes:
         model: the name of the OpenAI model to use for the inference.
+        organization: the OpenAI organization that owns the model, if any.
+        pool: the `CredentialPool` to spread the requests across, if any.
+        resilience: the `Resilience` layer in use, if any.
 
     Examples:
         >>> from opentrain import Inference
@@ -25,13 +36,29 @@ class Inference:
         'This is a sample completion.'
     """
 
-    def __init__(self, model: str) -> None:
+    def __init__(
+        self,
+        model: str,
+        organization: Union[str, None] = None,
+        pool: Union[CredentialPool, None] = None,
+        resilience: Union[Resilience, None] = None,
+    ) -> None:
         """Initializes the `Inference` class.
 
         Args:
             model: the name of the OpenAI model to use for the inference.
+            organization: the OpenAI organization that owns the model. Defaults to
+                None.
+            pool: the `CredentialPool` to spread the requests across. Defaults to
+                None, meaning that the global `openai.api_key` is used.
+            resilience: the `Resilience` layer with the deadline, hedging, and
+                circuit breaker to use. Defaults to None, meaning a single blocking
+                request.
         """
         self.model = model
+        self.organization = organization
+        self.pool = pool
+        self.resilience = resilience
 
     def __call__(self, prompt: str, **kwargs) -> str:
         """Generates the completion for a given prompt.
@@ -56,30 +83,64 @@ class Inference:
                 UserWarning,
                 stacklevel=2,
             )
-        response = openai.Completion.create(
+        kwargs.update(
+            pool=self.pool,
+            organization=self.organization,
             model=self.model,
             prompt=prompt,
-            **kwargs,
         )
+        if self.resilience:
+            response = self.resilience.call(
+                partial(request, openai.Completion.create), **kwargs
+            )
+        else:
+            response = request(openai.Completion.create, **kwargs)
         return response.choices[0].text
 
     @classmethod
-    def from_fine_tune_id(cls, fine_tune_id: str) -> "Inference":
+    def from_fine_tune_id(
+        cls, fine_tune_id: str, pool: Union[CredentialPool, None] = None
+    ) -> "Inference":
         """Returns an `Inference` object from an OpenAI fine-tune ID.
 
         Args:
             fine_tune_id: the ID of the OpenAI fine-tune to use for the inference.
+            pool: the `CredentialPool` to spread the requests across. Defaults to
+                None, meaning that the global `openai.api_key` is used.
 
         Returns:
             An `Inference` object.
         """
-        model = openai.FineTune.retrieve(fine_tune_id).fine_tuned_model
+        if pool is None:
+            model = openai.FineTune.retrieve(fine_tune_id).fine_tuned_model
+            organization = None
+        else:
+            # The fine-tune is only visible to its owner
+            for organization, api_key in pool.owners:
+                try:
+                    fine_tune = pool.request(
+                        openai.FineTune.retrieve,
+                        organization=organization,
+                        api_key=api_key,
+                        id=fine_tune_id,
+                    )
+                    break
+                except openai.error.InvalidRequestError:
+                    continue
+            else:
+                raise ValueError(
+                    f"The fine-tune {fine_tune_id} is not owned by any of the"
+                    " credentials in the pool."
+                )
+            model = fine_tune.fine_tuned_model
+            if model:
+                pool.register_model(model, organization, api_key)
         if model is None:
             raise ValueError(
                 "The model is not fine-tuned yet! Please wait a few minutes and try"
                 " again."
             )
-        return cls(model=model)
+        return cls(model=model, organization=organization, pool=pool)
 
 
 def list_fine_tunes() -> List[FineTune]:
@@ -0,0 +1,312 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Union
+
+from openai.error import (
+    APIConnectionError,
+    APIError,
+    ServiceUnavailableError,
+    Timeout,
+    TryAgain,
+)
+
+# Errors that signal a degraded upstream, rather than an invalid request
+DEGRADATION_ERRORS = (
+    APIError,
+    APIConnectionError,
+    ServiceUnavailableError,
+    Timeout,
+    TryAgain,
+    TimeoutError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open, so the request is not even sent."""
+
+    pass
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a request doesn't complete within its deadline."""
+
+    pass
+
+
+class LatencyTracker:
+    """Tracks the latencies of the most recent requests, so that the hedging delay
+    adapts to the current latency of the upstream.
+
+    Args:
+        window: the number of recent latencies to keep. Defaults to 100.
+        min_samples: the minimum number of latencies before computing percentiles.
+            Defaults to 20.
+    """
+
+    def __init__(self, window: int = 100, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        """Records the latency, in seconds, of a successful request."""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, q: float) -> Union[float, None]:
+        """Returns the `q`-th percentile of the recent latencies (nearest-rank), or
+        None if there are not enough samples yet."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[max(math.ceil(q / 100 * len(latencies)) - 1, 0)]
+
+
+class CircuitBreaker:
+    """Fails fast when the upstream is degraded. After `failure_threshold` consecutive
+    failures that signal a degraded upstream (5xx, timeouts, connection errors, or
+    missed deadlines) the circuit opens and every request fails immediately, until
+    after `reset_timeout` seconds a single trial request is let through (half-open),
+    which either closes the circuit again or re-opens it. If the trial request is
+    still pending after another `reset_timeout` seconds, e.g. as there's no deadline,
+    another one is let through, so that a hanging request doesn't keep the circuit
+    open. Any other error, such as an invalid request, is not counted as a failure.
+
+    Args:
+        failure_threshold: the consecutive failures that open the circuit. Defaults
+            to 5.
+        reset_timeout: the seconds the circuit stays open. Defaults to 30.0.
+
+    Attributes:
+        failure_threshold: the consecutive failures that open the circuit.
+        reset_timeout: the seconds the circuit stays open.
+        state: either `closed`, `open`, or `half-open`.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Returns whether a request can be sent to the upstream."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if (
+                self.state == "open" and now - self._opened_at >= self.reset_timeout
+            ) or (
+                self.state == "half-open" and now - self._trial_at >= self.reset_timeout
+            ):
+                self.state = "half-open"
+                self._trial_at = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def release(self) -> None:
+        """Releases the trial request of the half-open state without an outcome, e.g.
+        when it failed due to an invalid request, so that another one is let through.
+        """
+        with self._lock:
+            if self.state == "half-open":
+                self.state = "open"
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class Resilience:
+    """The `Resilience` class is an opt-in layer to control the tail latency of the
+    OpenAI requests. Every call gets a deadline, and whenever a call takes longer than
+    the `hedge_percentile` of the recent latencies, a hedged duplicate request is sent
+    and the first response wins, while the other one is abandoned. Additionally, a
+    `CircuitBreaker` fails fast when the upstream is degraded.
+
+    Note that the abandoned requests can't be interrupted, but those are bounded by
+    the deadline, as it's also sent to OpenAI as the `request_timeout`, and those run
+    in daemon threads so that they never block the interpreter exit. `Resilience` can
+    also be used as a context manager, so that no more calls are accepted after it.
+
+    Args:
+        deadline: the maximum seconds per call. Defaults to None, meaning no deadline.
+        hedge_percentile: the percentile of the recent latencies after which the
+            hedged request is sent. Defaults to 95.0.
+        circuit_breaker: the `CircuitBreaker` to use. Defaults to None, meaning that
+            a `CircuitBreaker` with the default values is used.
+        latency_tracker: the `LatencyTracker` to use. Defaults to None, meaning that
+            a `LatencyTracker` with the default values is used.
+        max_workers: the maximum number of concurrent requests, including the hedged
+            ones. Defaults to 16.
+
+    Attributes:
+        deadline: the maximum seconds per call.
+        hedge_percentile: the percentile of the recent latencies after which the
+            hedged request is sent.
+        circuit_breaker: the `CircuitBreaker` in use.
+        latency_tracker: the `LatencyTracker` in use.
+
+    Examples:
+        >>> from opentrain import Inference, Resilience
+        >>> with Resilience(deadline=2.0, hedge_percentile=95.0) as resilience:
+                inference = Inference(
+                    model="curie:ft-personal-<DATE>", resilience=resilience
+                )
+                inference(prompt="This is a sample prompt.")
+        'This is a sample completion.'
+    """
+
+    def __init__(
+        self,
+        deadline: Union[float, None] = None,
+        hedge_percentile: float = 95.0,
+        circuit_breaker: Union[CircuitBreaker, None] = None,
+        latency_tracker: Union[LatencyTracker, None] = None,
+        max_workers: int = 16,
+    ) -> None:
+        """Initializes the `Resilience` class.
+
+        Args:
+            deadline: the maximum seconds per call. Defaults to None, meaning no
+                deadline.
+            hedge_percentile: the percentile of the recent latencies after which the
+                hedged request is sent. Defaults to 95.0.
+            circuit_breaker: the `CircuitBreaker` to use. Defaults to None, meaning
+                that a `CircuitBreaker` with the default values is used.
+            latency_tracker: the `LatencyTracker` to use. Defaults to None, meaning
+                that a `LatencyTracker` with the default values is used.
+            max_workers: the maximum number of concurrent requests, including the
+                hedged ones. Defaults to 16.
+        """
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.latency_tracker = latency_tracker or LatencyTracker()
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._closed = False
+
+    def __enter__(self) -> "Resilience":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stops accepting calls. The in-flight requests are abandoned, and since
+        those run in daemon threads, they don't block the interpreter exit."""
+        self._closed = True
+
+    def _submit(self, fn: Callable[..., Any], **kwargs) -> Future:
+        future = Future()
+
+        def _run() -> None:
+            with self._slots:
+                # The request may have been cancelled while waiting for a slot
+                if not future.set_running_or_notify_cancel():
+                    return
+                # Start the timer once a slot is available, so that the time waiting
+                # for one is not recorded as upstream latency
+                start = time.monotonic()
+                try:
+                    response = fn(**kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                    return
+                self.latency_tracker.record(time.monotonic() - start)
+                future.set_result(response)
+
+        threading.Thread(target=_run, name="opentrain-resilience", daemon=True).start()
+        return future
+
+    def call(self, fn: Callable[..., Any], **kwargs) -> Any:
+        """Calls the function within the deadline, hedging it if it's slow.
+
+        Args:
+            fn: the OpenAI API function, e.g. `openai.Completion.create`.
+            **kwargs: the keyword arguments to pass to `fn`.
+
+        Returns:
+            The first response of `fn`.
+
+        Raises:
+            RuntimeError: if the `Resilience` layer has been closed.
+            CircuitOpenError: if the circuit breaker is open.
+            DeadlineExceededError: if no response is received within the deadline.
+        """
+        if self._closed:
+            raise RuntimeError("The `Resilience` layer is closed.")
+        if not self.circuit_breaker.allow():
+            raise CircuitOpenError(
+                "The circuit breaker is open since the upstream is degraded, please"
+                " try again later."
+            )
+
+        expires_at = time.monotonic() + self.deadline if self.deadline else None
+        if self.deadline:
+            # Bound both the request and the openai client's `TryAgain` retries
+            kwargs.setdefault("request_timeout", self.deadline)
+            kwargs.setdefault("timeout", self.deadline)
+
+        def _remaining() -> Union[float, None]:
+            return max(expires_at - time.monotonic(), 0) if expires_at else None
+
+        pending = {self._submit(fn, **kwargs)}
+        hedge_delay = self.latency_tracker.percentile(self.hedge_percentile)
+        if hedge_delay is not None:
+            remaining = _remaining()
+            done, _ = wait(
+                pending,
+                timeout=hedge_delay
+                if remaining is None
+                else min(hedge_delay, remaining),
+            )
+            if not done and (remaining is None or remaining > hedge_delay):
+                pending.add(self._submit(fn, **kwargs))
+
+        error = None
+        while pending:
+            done, pending = wait(
+                pending, timeout=_remaining(), return_when=FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    self.circuit_breaker.record_success()
+                    return future.result()
+                error = future.exception()
+                if not isinstance(error, DEGRADATION_ERRORS):
+                    # e.g. an invalid request or authentication error, which is not
+                    # the upstream's fault, so it doesn't count as a failure
+                    for other in pending:
+                        other.cancel()
+                    self.circuit_breaker.release()
+                    raise error
+
+        for future in pending:
+            future.cancel()
+        self.circuit_breaker.record_failure()
+        if error is not None and not pending:
+            raise error
+        raise DeadlineExceededError(
+            f"The request didn't complete within the deadline of {self.deadline}s."
+        )
@@ -0,0 +1,351 @@
+import heapq
+import json
+import random
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+from opentrain.credentials import CredentialPool
+from opentrain.dataset import Dataset
+from opentrain.train import estimate_fine_tune
+from opentrain.utils import estimate_num_tokens, imap_bounded
+
+# Each reservoir item is a `(-priority, index, num_tokens, record)` tuple, so that the
+# `heapq` min-heap pops the record with the highest priority first, and the unique
+# index of the record in the corpus breaks the ties
+_Item = Tuple[float, int, int, Dict[str, str]]
+
+MAX_STRATA = 100
+# Roughly 400MB of text, following OpenAI's rule of thumb of ~4 characters per token
+MAX_MEMORY_TOKENS = 100_000_000
+
+
+def _check_num_strata(num_strata: int, max_strata: int) -> None:
+    if num_strata > max_strata:
+        raise ValueError(
+            f"There are more than {max_strata} strata, so the memory wouldn't be"
+            " bounded, since a reservoir is kept per stratum. This usually means that"
+            " the records are being stratified by a free-text field, so please use a"
+            " `stratify_by` key or function that returns a label instead, or increase"
+            " `max_strata`."
+        )
+
+
+@dataclass
+class Sample:
+    """The records sampled by the `StratifiedSampler`, ready to be uploaded to OpenAI.
+
+    Attributes:
+        records: the sampled records, in random order.
+        num_tokens: the estimated number of tokens of the sampled records.
+        strata: the number of sampled records per stratum.
+    """
+
+    records: List[Dict[str, str]]
+    num_tokens: int
+    strata: Dict[str, int] = field(default_factory=dict)
+
+    def estimate(
+        self,
+        model: str,
+        n_epochs: Union[int, None] = None,
+        tokens_per_second: Union[float, None] = None,
+    ) -> Dict[str, Union[float, None]]:
+        """Estimates the indicative cost and time of fine-tuning with `Train.train` on
+        the sampled records. See `opentrain.train.estimate_fine_tune`.
+
+        Args:
+            model: the OpenAI model name to be used for training/fine-tuning.
+            n_epochs: the number of epochs to train the model for. Defaults to None,
+                meaning OpenAI's default of 4 epochs.
+            tokens_per_second: the training throughput of the model. Defaults to
+                None, meaning that the time is not estimated.
+
+        Returns:
+            A dictionary with the `trained_tokens`, the `cost` in USD, and the
+            `seconds`, which is None if `tokens_per_second` is not provided.
+        """
+        return estimate_fine_tune(
+            model,
+            self.num_tokens,
+            n_epochs=n_epochs,
+            tokens_per_second=tokens_per_second,
+        )
+
+    def to_dataset(
+        self,
+        file_name: Union[str, None] = None,
+        organization: Union[str, None] = None,
+        pool: Union[CredentialPool, None] = None,
+    ) -> Dataset:
+        """Uploads the sampled records to OpenAI and returns a `Dataset` object.
+
+        Args:
+            file_name: the name of the file to be defined in OpenAI. Defaults to None.
+            organization: the OpenAI organization name. Defaults to None.
+            pool: the `CredentialPool` to spread the requests across. Defaults to
+                None, meaning that the global `openai.api_key` is used.
+
+        Returns:
+            A `Dataset` object.
+        """
+        return Dataset.from_records(
+            records=self.records,
+            file_name=file_name,
+            organization=organization,
+            pool=pool,
+        )
+
+
+def _push(
+    reservoir: List[_Item],
+    total: List[int],
+    item: _Item,
+    max_tokens: Union[int, None],
+    max_rows: Union[int, None],
+) -> None:
+    """Pushes an item into a bottom-k reservoir, and then evicts the items with the
+    highest priority that are not needed to fill either `max_tokens` or `max_rows`."""
+    heapq.heappush(reservoir, item)
+    total[0] += item[2]
+    while reservoir and (
+        (max_rows is not None and len(reservoir) > max_rows)
+        or (max_tokens is not None and total[0] - reservoir[0][2] >= max_tokens)
+    ):
+        total[0] -= heapq.heappop(reservoir)[2]
+
+
+def _sample_chunk(
+    chunk: Tuple[int, List[Dict[str, str]]],
+    stratify_by: Union[str, Callable[[Dict[str, str]], str]],
+    max_tokens: Union[int, None],
+    max_rows: Union[int, None],
+    max_strata: int,
+    seed: int,
+) -> Dict[str, Tuple[List[_Item], List[int]]]:
+    """Builds a reservoir per stratum for a chunk of records, i.e. the offset of its
+    first record in the corpus and the records, using random priorities so that the
+    reservoirs of different chunks can be merged."""
+    offset, records = chunk
+    generator = random.Random(seed + offset)
+    reservoirs = {}
+    for idx, record in enumerate(records, start=offset):
+        stratum = (
+            stratify_by(record)
+            if callable(stratify_by)
+            else str(record.get(stratify_by, "")).strip()
+        )
+        num_tokens = estimate_num_tokens(
+            record.get("prompt", "") + record.get("completion", "")
+        )
+        reservoir, total = reservoirs.setdefault(stratum, ([], [0]))
+        _check_num_strata(len(reservoirs), max_strata)
+        _push(
+            reservoir,
+            total,
+            (-generator.random(), idx, num_tokens, record),
+            max_tokens,
+            max_rows,
+        )
+    return reservoirs
+
+
+class StratifiedSampler:
+    """The `StratifiedSampler` class subsamples a large training corpus to a token
+    and/or row budget while keeping the class balance, since both the fine-tune cost
+    and time scale with the number of training tokens times `n_epochs`.
+
+    The corpus is streamed once, keeping a bottom-k reservoir sample per stratum
+    (keyed on the completion by default) just large enough to fill the whole budget,
+    as any stratum may end up filling it. So the memory is bounded by the budget
+    times the number of strata, rather than by the size of the corpus, e.g. up to
+    200M tokens for a budget of 2M tokens and 100 strata. Hence the number of strata
+    is capped by `max_strata`, as stratifying by a free-text completion would mean a
+    stratum per record, and the tokens kept in memory are capped by
+    `max_memory_tokens`. The chunks can be sampled in parallel, as the reservoirs of different chunks are
+    merged exactly. Finally, the budget is split evenly among the strata, and the
+    share left unused by the smaller strata is given to the larger ones.
+
+    Args:
+        max_tokens: the target number of tokens. Defaults to None.
+        max_rows: the target number of records. Defaults to None.
+        stratify_by: either the key of the record to stratify by, or a function that
+            returns the stratum of a record, which must be picklable if
+            `num_workers > 1`. Defaults to `completion`.
+        num_workers: the number of processes used to sample the chunks. Defaults to
+            1.
+        chunk_size: the number of records per chunk. Defaults to 100000.
+        max_strata: the maximum number of strata, so that the memory is bounded.
+            Defaults to 100.
+        max_memory_tokens: the maximum number of tokens kept in memory across all
+            the strata. Defaults to 100000000, and None means no limit.
+        seed: the seed used to sample the records. Defaults to 42.
+
+    Attributes:
+        max_tokens: the target number of tokens.
+        max_rows: the target number of records.
+        stratify_by: the key or function used to stratify the records.
+        num_workers: the number of processes used to sample the chunks.
+        chunk_size: the number of records per chunk.
+        max_strata: the maximum number of strata.
+        max_memory_tokens: the maximum number of tokens kept in memory.
+        seed: the seed used to sample the records.
+
+    Examples:
+        >>> from opentrain import StratifiedSampler, Train
+        >>> sampler = StratifiedSampler(max_tokens=2_000_000, num_workers=4)
+        >>> sample = sampler.sample("data.jsonl")
+        >>> sample.estimate("curie", n_epochs=4, tokens_per_second=2_500)
+        >>> trainer = Train(model="curie")
+        >>> trainer.train(sample.to_dataset(), n_epochs=4)
+    """
+
+    def __init__(
+        self,
+        max_tokens: Union[int, None] = None,
+        max_rows: Union[int, None] = None,
+        stratify_by: Union[str, Callable[[Dict[str, str]], str]] = "completion",
+        num_workers: int = 1,
+        chunk_size: int = 100_000,
+        max_strata: int = MAX_STRATA,
+        max_memory_tokens: Union[int, None] = MAX_MEMORY_TOKENS,
+        seed: int = 42,
+    ) -> None:
+        """Initializes the `StratifiedSampler` class.
+
+        Args:
+            max_tokens: the target number of tokens. Defaults to None.
+            max_rows: the target number of records. Defaults to None.
+            stratify_by: either the key of the record to stratify by, or a function
+                that returns the stratum of a record, which must be picklable if
+                `num_workers > 1`. Defaults to `completion`.
+            num_workers: the number of processes used to sample the chunks. Defaults
+                to 1.
+            chunk_size: the number of records per chunk. Defaults to 100000.
+            max_strata: the maximum number of strata, so that the memory is bounded.
+                Defaults to 100.
+            max_memory_tokens: the maximum number of tokens kept in memory across
+                all the strata. Defaults to 100000000, and None means no limit.
+            seed: the seed used to sample the records. Defaults to 42.
+
+        Raises:
+            ValueError: if neither `max_tokens` nor `max_rows` are provided.
+        """
+        if max_tokens is None and max_rows is None:
+            raise ValueError(
+                "You must provide either `max_tokens`, `max_rows`, or both, to be used"
+                " as the budget of the sample."
+            )
+        self.max_tokens = max_tokens
+        self.max_rows = max_rows
+        self.stratify_by = stratify_by
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self.max_strata = max_strata
+        self.max_memory_tokens = max_memory_tokens
+        self.seed = seed
+
+    def _chunks(
+        self, source: Union[str, Path, Iterable[Dict[str, str]]]
+    ) -> Iterator[Tuple[int, List[Dict[str, str]]]]:
+        if isinstance(source, (str, Path)):
+            with open(source, "r") as f:
+                yield from self._chunks(json.loads(line) for line in f if line.strip())
+            return
+        offset, chunk = 0, []
+        for record in source:
+            chunk.append(record)
+            if len(chunk) == self.chunk_size:
+                yield offset, chunk
+                offset, chunk = offset + len(chunk), []
+        if chunk:
+            yield offset, chunk
+
+    def _reservoirs(
+        self, source: Union[str, Path, Iterable[Dict[str, str]]]
+    ) -> Dict[str, List[_Item]]:
+        merged, num_tokens = {}, 0
+        for reservoirs in imap_bounded(
+            _sample_chunk,
+            self._chunks(source),
+            self.num_workers,
+            self.stratify_by,
+            self.max_tokens,
+            self.max_rows,
+            self.max_strata,
+            self.seed,
+        ):
+            for stratum, (items, _) in reservoirs.items():
+                reservoir, total = merged.setdefault(stratum, ([], [0]))
+                _check_num_strata(len(merged), self.max_strata)
+                num_tokens -= total[0]
+                for item in items:
+                    _push(reservoir, total, item, self.max_tokens, self.max_rows)
+                num_tokens += total[0]
+            if (
+                self.max_memory_tokens is not None
+                and num_tokens > self.max_memory_tokens
+            ):
+                raise ValueError(
+                    f"The reservoirs of the {len(merged)} strata hold more than"
+                    f" {self.max_memory_tokens} tokens, as each of those is sized to"
+                    " the whole budget. Please reduce either the budget or the number"
+                    " of strata, or increase `max_memory_tokens`."
+                )
+
+        # Sort each reservoir by ascending priority, i.e. a uniform random order
+        return {
+            stratum: sorted(reservoir, reverse=True)
+            for stratum, (reservoir, _) in merged.items()
+        }
+
+    def sample(self, source: Union[str, Path, Iterable[Dict[str, str]]]) -> Sample:
+        """Samples the records within the budget, keeping the class balance.
+
+        Args:
+            source: either the path to a local JSONL file, or an iterable of records,
+                each of those with a `prompt` and a `completion`.
+
+        Returns:
+            A `Sample` with the sampled records.
+
+        Raises:
+            ValueError: if there are more strata than `max_strata`, or the reservoirs
+                hold more tokens than `max_memory_tokens`.
+        """
+        reservoirs = self._reservoirs(source)
+
+        tokens_left = self.max_tokens
+        rows_left = self.max_rows
+        selected, strata = [], {}
+        # Fill the smaller strata first, so that their unused share goes to the rest
+        ordered = sorted(
+            reservoirs, key=lambda s: sum(item[2] for item in reservoirs[s])
+        )
+        for idx, stratum in enumerate(ordered):
+            num_strata_left = len(ordered) - idx
+            token_share = (
+                None if tokens_left is None else tokens_left // num_strata_left
+            )
+            row_share = None if rows_left is None else rows_left // num_strata_left
+            num_tokens = num_rows = 0
+            for item in reservoirs[stratum]:
+                if (token_share is not None and num_tokens + item[2] > token_share) or (
+                    row_share is not None and num_rows + 1 > row_share
+                ):
+                    break
+                selected.append(item)
+                num_tokens += item[2]
+                num_rows += 1
+            strata[stratum] = num_rows
+            if tokens_left is not None:
+                tokens_left -= num_tokens
+            if rows_left is not None:
+                rows_left -= num_rows
+
+        selected.sort(reverse=True)
+        return Sample(
+            records=[item[3] for item in selected],
+            num_tokens=sum(item[2] for item in selected),
+            strata=strata,
+        )
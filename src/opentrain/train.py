@@ -1,5 +1,5 @@
 import warnings
-from typing import Any, Dict, Iterator
+from typing import Any, Dict, Iterator, Union
 
 import openai
 
@@ -10,6 +10,16 @@ warnings.simplefilter("once", category=UserWarning)
 
 DEFAULT_OPENAI_MODELS = ["ada", "babbage", "curie", "davinci"]
 
+# Training price in USD per 1K tokens, see https://openai.com/pricing
+FINE_TUNE_PRICE_PER_1K_TOKENS = {
+    "ada": 0.0004,
+    "babbage": 0.0006,
+    "curie": 0.0030,
+    "davinci": 0.0300,
+}
+# Default `n_epochs` used by OpenAI's FineTune API
+DEFAULT_N_EPOCHS = 4
+
 
 class Train:
     """The `Train` class is a wrapper around OpenAI's FineTune API, and it also
@@ -154,3 +164,39 @@ class Train:
 
 class FineTune(Train):
     pass
+
+
+def estimate_fine_tune(
+    model: str,
+    num_tokens: int,
+    n_epochs: Union[int, None] = None,
+    tokens_per_second: Union[float, None] = None,
+) -> Dict[str, Union[float, None]]:
+    """Estimates the indicative cost and time of fine-tuning an OpenAI model, since
+    both scale with the number of training tokens times `n_epochs`. OpenAI doesn't
+    publish the training throughput, so the time is just estimated if provided, e.g.
+    measured from the `trained_tokens` and duration of your previous fine-tunes, and
+    it doesn't include the time spent in OpenAI's queue.
+
+    Args:
+        model: the OpenAI model name to be used for training/fine-tuning.
+        num_tokens: the number of tokens in the training dataset.
+        n_epochs: the number of epochs to train the model for. Defaults to None,
+            meaning OpenAI's default of 4 epochs.
+        tokens_per_second: the training throughput of the model. Defaults to None,
+            meaning that the time is not estimated.
+
+    Returns:
+        A dictionary with the `trained_tokens`, the `cost` in USD, and the `seconds`,
+        which is None if `tokens_per_second` is not provided.
+    """
+    assert model in DEFAULT_OPENAI_MODELS, (
+        "Invalid OpenAI model, it must be one of the following:"
+        f" {','.join(DEFAULT_OPENAI_MODELS)}."
+    )
+    trained_tokens = num_tokens * (n_epochs or DEFAULT_N_EPOCHS)
+    return {
+        "trained_tokens": trained_tokens,
+        "cost": trained_tokens / 1000 * FINE_TUNE_PRICE_PER_1K_TOKENS[model],
+        "seconds": trained_tokens / tokens_per_second if tokens_per_second else None,
+    }
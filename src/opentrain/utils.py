@@ -0,0 +1,69 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator
+
+try:
+    import tiktoken
+
+    has_tiktoken = True
+except ImportError:
+    has_tiktoken = False
+
+AVERAGE_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _get_encoding() -> "tiktoken.Encoding":
+    """Loads the GPT-3 encoding lazily, as `tiktoken` downloads it on first use."""
+    # GPT-3 base models (ada, babbage, curie, davinci) use the `r50k_base` encoding
+    return tiktoken.get_encoding("r50k_base")
+
+
+def estimate_num_tokens(text: str) -> int:
+    """Estimates the number of tokens of a given text. If `tiktoken` is installed the
+    tokens are counted using the GPT-3 encoding, otherwise it falls back to OpenAI's
+    rule of thumb of ~4 characters per token.
+
+    Args:
+        text: the text to estimate the number of tokens for.
+
+    Returns:
+        The estimated number of tokens.
+    """
+    if has_tiktoken:
+        return len(_get_encoding().encode(text, disallowed_special=()))
+    return -(-len(text) // AVERAGE_CHARS_PER_TOKEN)
+
+
+def imap_bounded(
+    fn: Callable[..., Any], iterable: Iterable[Any], num_workers: int, *args: Any
+) -> Iterator[Any]:
+    """Maps a function over a stream of items, e.g. chunks of records, using several
+    processes, while keeping just a bounded amount of items in-flight, so that the
+    memory is bounded regardless of the length of the stream.
+
+    Args:
+        fn: the function to call as `fn(item, *args)`, which must be picklable if
+            `num_workers > 1`.
+        iterable: the items to map the function over.
+        num_workers: the number of processes. If lower than 2, the function is just
+            called in the current process.
+        *args: the additional arguments to pass to the function.
+
+    Yields:
+        The results of the function, in the same order as the items.
+    """
+    if num_workers <= 1:
+        for item in iterable:
+            yield fn(item, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = deque()
+        for item in iterable:
+            futures.append(executor.submit(fn, item, *args))
+            if len(futures) >= 2 * num_workers:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
@@ -0,0 +1,193 @@
+import asyncio
+import threading
+
+import openai
+import pytest
+from openai.error import RateLimitError
+
+from opentrain.credentials import Credential, CredentialPool
+from opentrain.dataset import Dataset, list_datasets
+
+
+def test_credential_pool_spreads_load() -> None:
+    pool = CredentialPool(["sk-1", "sk-2", "sk-3"])
+    with pool.acquire() as first, pool.acquire() as second, pool.acquire() as third:
+        assert {first.api_key, second.api_key, third.api_key} == {
+            "sk-1",
+            "sk-2",
+            "sk-3",
+        }
+    assert all(credential.in_flight == 0 for credential in pool.credentials)
+
+
+def test_credential_pool_round_robin() -> None:
+    pool = CredentialPool(["sk-1", "sk-2", "sk-3"])
+
+    def create(api_key: str, organization: str, **kwargs) -> str:
+        return api_key
+
+    keys = [pool.request(create) for _ in range(6)]
+    assert keys == ["sk-1", "sk-2", "sk-3"] * 2
+
+
+def test_credential_pool_tracks_rate_limit_headers() -> None:
+    pool = CredentialPool(["sk-1", "sk-2"])
+    pool.report_headers(
+        pool.credentials[0],
+        {"x-ratelimit-remaining-requests": "1", "x-ratelimit-reset-requests": "6m0s"},
+    )
+    with pool.acquire() as credential:
+        assert credential.api_key == "sk-1"
+    for _ in range(2):
+        with pool.acquire() as credential:
+            assert credential.api_key == "sk-2"
+
+    pool.report_headers(
+        pool.credentials[1],
+        {"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "20ms"},
+    )
+    assert pool.credentials[1].drained_until > 0
+
+
+def test_credential_pool_drains_rate_limited_keys() -> None:
+    pool = CredentialPool(["sk-1", "sk-2"], cooldown=60.0)
+    calls = []
+
+    def create(api_key: str, organization: str, **kwargs) -> str:
+        calls.append(api_key)
+        if api_key == "sk-1":
+            raise RateLimitError("Rate limit reached", http_status=429)
+        return kwargs["prompt"]
+
+    assert pool.request(create, prompt="A") == "A"
+    assert pool.request(create, prompt="B") == "B"
+    assert calls.count("sk-1") == 1
+    assert pool.credentials[0].rate_limits == 1
+
+
+def test_credential_pool_respects_requests_per_minute() -> None:
+    pool = CredentialPool(
+        [Credential("sk-1", requests_per_minute=1), Credential("sk-2")]
+    )
+    with pool.acquire():
+        pass
+    with pool.acquire() as credential:
+        assert credential.api_key == "sk-2"
+
+
+def test_credential_pool_routes_models_to_organization() -> None:
+    pool = CredentialPool([("sk-1", "org-1"), ("sk-2", "org-2")])
+    pool.register_model("curie:ft-org-2", "org-2")
+
+    def create(api_key: str, organization: str, **kwargs) -> str:
+        return organization
+
+    for _ in range(4):
+        assert pool.request(create, model="curie:ft-org-2") == "org-2"
+    with pytest.raises(ValueError):
+        pool.request(create, organization="org-3")
+
+
+def test_credential_pool_is_thread_safe() -> None:
+    pool = CredentialPool(["sk-1", "sk-2"])
+    results = []
+
+    def create(api_key: str, organization: str, **kwargs) -> str:
+        return api_key
+
+    threads = [
+        threading.Thread(target=lambda: results.append(pool.request(create)))
+        for _ in range(32)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 32
+    assert all(credential.in_flight == 0 for credential in pool.credentials)
+
+
+def test_credential_pool_arequest() -> None:
+    pool = CredentialPool(["sk-1", "sk-2"])
+
+    async def acreate(api_key: str, organization: str, **kwargs) -> str:
+        await asyncio.sleep(0.01)
+        return api_key
+
+    async def main() -> list:
+        return await asyncio.gather(*[pool.arequest(acreate) for _ in range(4)])
+
+    assert sorted(asyncio.run(main())) == ["sk-1", "sk-1", "sk-2", "sk-2"]
+
+
+def test_credential_pool_looks_up_unregistered_models(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    pool = CredentialPool([("sk-1", "org-1"), "sk-2"])
+    lookups = []
+
+    def mock_list(api_key: str, organization: str, **kwargs) -> dict:
+        lookups.append(api_key)
+        owner = organization or api_key
+        return {"data": [{"fine_tuned_model": f"curie:ft-{owner}"}]}
+
+    def create(api_key: str, organization: str, **kwargs) -> tuple:
+        return organization, api_key
+
+    monkeypatch.setattr(openai.FineTune, "list", mock_list)
+
+    for _ in range(4):
+        assert pool.request(create, model="curie:ft-sk-2") == (None, "sk-2")
+        assert pool.request(create, model="curie:ft-org-1")[0] == "org-1"
+    assert sorted(lookups) == ["sk-1", "sk-2"]
+    with pytest.raises(ValueError):
+        pool.request(create, model="curie:ft-unknown")
+
+
+@pytest.mark.parametrize(
+    "credentials",
+    [[("sk-a", "org-a"), ("sk-b", "org-b")], ["sk-a", "sk-b"]],
+    ids=["organizations", "api-keys"],
+)
+def test_dataset_is_pinned_to_owner(
+    monkeypatch: pytest.MonkeyPatch, training_data: list, credentials: list
+) -> None:
+    pool = CredentialPool(credentials, cooldown=0.05)
+
+    def mock_create(file, api_key: str, organization: str, **kwargs) -> openai.File:
+        file.close()
+        owner = organization or api_key
+        return openai.File.construct_from({"id": f"file-{owner}"}, api_key)
+
+    def mock_retrieve(id: str, api_key: str, organization: str, **kwargs) -> dict:
+        # Every owner has a single file, which is not visible to the rest
+        if id != f"file-{organization or api_key}":
+            raise openai.error.InvalidRequestError("No such File object", "id")
+        return {"id": id, "owner": organization or api_key}
+
+    def mock_list(api_key: str, organization: str, **kwargs) -> dict:
+        return {"data": [{"id": f"file-{organization or api_key}"}]}
+
+    monkeypatch.setattr(openai.File, "create", mock_create)
+    monkeypatch.setattr(openai.File, "retrieve", mock_retrieve)
+    monkeypatch.setattr(openai.File, "list", mock_list)
+
+    dataset = Dataset.from_records(
+        training_data, file_name="opentrain-test-pool", pool=pool
+    )
+    owner = dataset.organization or dataset.api_key
+    credential = next(
+        c for c in pool.credentials if owner in (c.organization, c.api_key)
+    )
+    # Drain the key that received the upload, so any other key would be picked
+    pool.report_rate_limit(credential)
+    for _ in range(4):
+        assert dataset.info["owner"] == owner
+        del dataset.info
+
+    datasets = list_datasets(pool=pool)
+    assert sorted(d.file_id for d in datasets) == [
+        f"file-{c.organization or c.api_key}" for c in pool.credentials
+    ]
+    for dataset in datasets:
+        assert dataset.info["id"] == dataset.file_id
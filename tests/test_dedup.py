@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from opentrain.dedup import Deduplicator, deduplicate  # noqa: E402
+
+
+@pytest.fixture
+def records() -> list:
+    """Mock corpus with near-duplicate prompts."""
+    return [
+        {
+            "prompt": (
+                "I love sci-fi and am willing to put up with a lot. Sci-fi movies/TV"
+                " are usually underfunded, under-appreciated and misunderstood ->"
+            ),
+            "completion": " pos",
+        },
+        {
+            "prompt": (
+                "I love sci-fi and am willing to put up with a lot. Sci-fi movies/TV"
+                " are usually underfunded, under-appreciated and misunderstood!! ->"
+            ),
+            "completion": " pos",
+        },
+        {
+            "prompt": "The makers of Earth KNOW it's rubbish as they have to ->",
+            "completion": " neg",
+        },
+        {
+            "prompt": (
+                "I  LOVE sci-fi and am willing to put up with a lot. Sci-fi movies/TV"
+                " are usually underfunded, under-appreciated and misunderstood ->"
+            ),
+            "completion": " pos",
+        },
+    ]
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_deduplicate(records: list, num_workers: int) -> None:
+    deduplicated, report = deduplicate(records, num_workers=num_workers, chunk_size=2)
+    assert deduplicated == [records[0], records[2]]
+    assert report.num_records == 4
+    assert report.num_duplicates == 2
+    assert report.bytes_saved > 0
+    assert report.tokens_saved > 0
+
+
+def test_deduplicator_is_lazy(records: list) -> None:
+    deduplicator = Deduplicator()
+    stream = deduplicator.deduplicate(iter(records))
+    assert deduplicator.report is None
+    assert len(list(stream)) == 2
+    assert deduplicator.report.num_duplicates == 2
@@ -0,0 +1,67 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from opentrain.evaluate import Evaluator, compute_metrics  # noqa: E402
+from opentrain.inference import Inference  # noqa: E402
+
+
+def test_compute_metrics() -> None:
+    references = [" pos", " neg", " neg", " pos"]
+    predictions = [" pos", "neg", " pos", " pos"]
+    metrics = compute_metrics(references, predictions)
+    assert metrics["labels"] == ["neg", "pos"]
+    assert metrics["confusion_matrix"] == [[1, 1], [0, 2]]
+    assert metrics["accuracy"] == 0.75
+    assert metrics["exact_match"] == 0.5
+    assert metrics["macro_f1"] == pytest.approx((2 / 3 + 0.8) / 2)
+    with pytest.raises(ValueError):
+        compute_metrics([], [])
+    with pytest.raises(ValueError):
+        compute_metrics(references, predictions[:2])
+
+
+def test_evaluator_cache(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    calls, failing = [], [True]
+
+    def mock_call(self, prompt: str, **kwargs) -> str:
+        calls.append((self.model, prompt))
+        if prompt == "C" and failing[0]:
+            raise ConnectionError("Transient error")
+        return " pos"
+
+    monkeypatch.setattr(Inference, "__call__", mock_call)
+    records = [{"prompt": prompt, "completion": " pos"} for prompt in "ABC"]
+    evaluator = Evaluator(models=["ada", "babbage"], max_workers=1, cache_dir=tmp_path)
+
+    with pytest.raises(ConnectionError):
+        evaluator.predict(records)
+    failing[0] = False
+    num_calls = len(calls)
+
+    # Just the failed predictions are requested again
+    predictions = evaluator.predict(records)
+    assert predictions == {"ada": [" pos"] * 3, "babbage": [" pos"] * 3}
+    assert sorted(calls[num_calls:]) == [("ada", "C"), ("babbage", "C")]
+
+    # Everything is cached, so no requests are sent at all
+    num_calls = len(calls)
+    evaluator.predict(records)
+    assert len(calls) == num_calls
+
+
+@pytest.mark.usefixtures("fine_tuned_model", "prompt")
+def test_evaluator(fine_tuned_model: str, prompt: str, tmp_path) -> None:
+    evaluator = Evaluator(models=[fine_tuned_model], cache_dir=tmp_path)
+    results = evaluator.evaluate(
+        [{"prompt": prompt, "completion": "neg"}], temperature=0.0, max_tokens=1
+    )
+    assert set(results[fine_tuned_model]) == {
+        "accuracy",
+        "macro_f1",
+        "exact_match",
+        "labels",
+        "confusion_matrix",
+    }
+    assert len(list(tmp_path.iterdir())) == 1
+    assert fine_tuned_model in evaluator.table()
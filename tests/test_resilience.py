@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List
+
+import openai
+import pytest
+
+from opentrain.inference import Inference
+from opentrain.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    LatencyTracker,
+    Resilience,
+)
+
+
+class MockServer(ThreadingHTTPServer):
+    """Mock OpenAI Completion API with injected latencies, consumed in order."""
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.latencies: List[float] = []
+        self.status = 200
+        self.num_requests = 0
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.num_requests += 1
+        if self.server.latencies:
+            time.sleep(self.server.latencies.pop(0))
+        body = json.dumps(
+            {
+                "id": "cmpl-1234",
+                "object": "text_completion",
+                "created": 0,
+                "model": "curie:ft-personal",
+                "choices": [
+                    {
+                        "text": "pos",
+                        "index": 0,
+                        "logprobs": None,
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+            if self.server.status == 200
+            else {"error": {"message": "Upstream degraded", "type": "server_error"}}
+        ).encode("utf-8")
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch: pytest.MonkeyPatch) -> Iterator[MockServer]:
+    server = MockServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(openai, "api_key", "sk-1234")
+    monkeypatch.setattr(openai, "api_base", f"http://127.0.0.1:{server.server_port}/v1")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_latency_tracker() -> None:
+    tracker = LatencyTracker(window=10, min_samples=5)
+    assert tracker.percentile(95) is None
+    for latency in range(1, 21):
+        tracker.record(latency)
+    assert tracker.percentile(50) == 15
+    assert tracker.percentile(100) == 20
+
+
+def test_hedged_request(server: MockServer) -> None:
+    tracker = LatencyTracker(min_samples=1)
+    tracker.record(0.05)
+    server.latencies = [1.0, 0.0]
+    inference = Inference(
+        "curie:ft-personal",
+        resilience=Resilience(deadline=5.0, latency_tracker=tracker),
+    )
+    start = time.monotonic()
+    assert inference("A") == "pos"
+    assert time.monotonic() - start < 0.9
+    assert server.num_requests == 2
+
+
+def test_deadline_exceeded(server: MockServer) -> None:
+    server.latencies = [1.0]
+    inference = Inference("curie:ft-personal", resilience=Resilience(deadline=0.2))
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        inference("A")
+    assert time.monotonic() - start < 0.9
+
+
+def test_circuit_breaker(server: MockServer) -> None:
+    server.status = 500
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    inference = Inference(
+        "curie:ft-personal", resilience=Resilience(circuit_breaker=breaker)
+    )
+    for _ in range(2):
+        with pytest.raises(openai.error.APIError):
+            inference("A")
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        inference("A")
+    assert server.num_requests == 2
+
+
+def test_circuit_breaker_ignores_invalid_requests(server: MockServer) -> None:
+    server.status = 400
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    inference = Inference(
+        "curie:ft-personal", resilience=Resilience(circuit_breaker=breaker)
+    )
+    for _ in range(3):
+        with pytest.raises(openai.error.InvalidRequestError):
+            inference("A")
+    assert breaker.state == "closed"
+    server.status = 200
+    assert inference("A") == "pos"
+
+
+def test_circuit_breaker_readmits_pending_trial() -> None:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half-open"
+    # The trial request is still pending, so no other one is let through yet
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_latency_excludes_queue_wait() -> None:
+    tracker = LatencyTracker(min_samples=100)
+
+    def create(**kwargs) -> str:
+        time.sleep(0.1)
+        return "pos"
+
+    with Resilience(latency_tracker=tracker, max_workers=1) as resilience:
+        threads = [
+            threading.Thread(target=resilience.call, args=(create,)) for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert len(tracker._latencies) == 3
+    assert max(tracker._latencies) < 0.18
+    with pytest.raises(RuntimeError):
+        resilience.call(create)
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from opentrain.sampler import StratifiedSampler
+from opentrain.train import estimate_fine_tune
+
+
+@pytest.fixture
+def records() -> list:
+    """Mock imbalanced corpus with 900 `pos` and 100 `neg` records."""
+    return [
+        {
+            "prompt": f"Review number {idx} ->",
+            "completion": " pos" if idx % 10 else " neg",
+        }
+        for idx in range(1000)
+    ]
+
+
+def test_sampler_max_rows(records: list) -> None:
+    sample = StratifiedSampler(max_rows=100).sample(records)
+    assert len(sample.records) == 100
+    assert sample.strata == {"neg": 50, "pos": 50}
+
+
+def test_sampler_max_tokens(records: list, tmp_path) -> None:
+    path = tmp_path / "data.jsonl"
+    with open(path, "w") as f:
+        for record in records:
+            json.dump(record, f)
+            f.write("\n")
+    sample = StratifiedSampler(max_tokens=5_000, chunk_size=100, num_workers=2).sample(
+        path.as_posix()
+    )
+    assert 4_900 <= sample.num_tokens <= 5_000
+    # The `neg` stratum is smaller than its share, so `pos` fills the rest
+    assert sample.strata["neg"] == 100
+    assert sample.strata["pos"] > 100
+
+
+def test_sampler_is_deterministic(records: list) -> None:
+    sampler = StratifiedSampler(max_rows=10, chunk_size=100)
+    assert sampler.sample(records).records == sampler.sample(records).records
+
+
+def test_sampler_max_strata(records: list) -> None:
+    sampler = StratifiedSampler(max_rows=10, stratify_by="prompt", max_strata=100)
+    with pytest.raises(ValueError):
+        sampler.sample(records)
+
+
+def test_sampler_max_memory_tokens(records: list) -> None:
+    sampler = StratifiedSampler(max_tokens=5_000, max_memory_tokens=5_000)
+    with pytest.raises(ValueError):
+        sampler.sample(records)
+
+
+def test_estimate_fine_tune() -> None:
+    estimate = estimate_fine_tune("curie", num_tokens=1_000, n_epochs=2)
+    assert estimate["trained_tokens"] == 2_000
+    assert estimate["cost"] == pytest.approx(0.006)
+    assert estimate["seconds"] is None
+    estimate = estimate_fine_tune("curie", 1_000, n_epochs=2, tokens_per_second=100)
+    assert estimate["seconds"] == 20